@@ -0,0 +1,12 @@
+"""
+HomeStream - gunicorn configuration
+Loaded automatically when running `gunicorn wsgi:app` from this directory
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:3000'
+worker_class = 'gthread'
+workers = multiprocessing.cpu_count() * 2 + 1
+threads = 8  # Matches DB_POOL_SIZE in server.py
+keepalive = 30
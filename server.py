@@ -4,12 +4,21 @@ A Netflix-style streaming server for your local network
 """
 
 import os
-import json
-import uuid
+import functools
+import mimetypes
+import queue
+import re
+import secrets
+import shutil
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from pathlib import Path
-from flask import Flask, request, jsonify, send_file, send_from_directory, Response
+from types import MappingProxyType
+import orjson
+from flask import Flask, Request, request, jsonify, send_file, send_from_directory, Response
 
 app = Flask(__name__, static_folder=None)
 
@@ -17,55 +26,294 @@ app = Flask(__name__, static_folder=None)
 BASE_DIR = Path(__file__).parent
 MEDIA_DIR = BASE_DIR / 'media'
 VIDEOS_DIR = MEDIA_DIR / 'videos'
+VIDEOS_DIR_STR = str(VIDEOS_DIR)
 THUMBNAILS_DIR = MEDIA_DIR / 'thumbnails'
+TRASH_DIR = MEDIA_DIR / '.trash'
+UPLOADS_DIR = MEDIA_DIR / '.uploads'
+PUBLIC_DIR = BASE_DIR / 'public'
 DB_PATH = BASE_DIR / 'homestream.db'
+DB_POOL_SIZE = 8  # Keep in line with the server's thread count (see gunicorn.conf.py)
+DB_STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB copy buffer for uploads
+STREAM_CHUNK_SIZE = 1 << 20  # 1 MiB blocks for ranged video responses
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60  # Browser cache lifetimes for /media
+VIDEO_MAX_AGE = 60 * 60
+TRASH_EMPTY_INTERVAL = 60  # Seconds between sweeps of deleted media
+UPLOAD_STALE_AGE = 60 * 60  # Untouched upload spools older than this are abandoned
+
+# Media file and directory names we accept; anything else (including hidden
+# names and '..') is rejected before touching the filesystem
+_SAFE_NAME = re.compile(r'[A-Za-z0-9_-][A-Za-z0-9._-]{0,254}')
+# Upload extensions kept on stored names, so every stored name passes _SAFE_NAME
+_SAFE_SUFFIX = re.compile(r'\.[A-Za-z0-9]{1,16}')
+
+# Single byte range as sent by video players: 'bytes=start-[end]' or 'bytes=-suffix'
+_RANGE_RE = re.compile(r'bytes=([0-9]*)-([0-9]*)')
+
+# Video content types by extension
+VIDEO_CONTENT_TYPES = MappingProxyType({
+    '.mp4': 'video/mp4',
+    '.webm': 'video/webm',
+    '.mkv': 'video/x-matroska',
+    '.avi': 'video/x-msvideo',
+    '.mov': 'video/quicktime',
+    '.m4v': 'video/mp4'
+})
+
+app.config['MAX_CONTENT_LENGTH'] = 10 * 1024 * 1024 * 1024  # 10GB upload limit
 
 # Create directories
 VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
 THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+TRASH_DIR.mkdir(parents=True, exist_ok=True)
+UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+
+def new_upload_spool():
+    """Unique path for a partially written upload in media/.uploads"""
+    return os.path.join(UPLOADS_DIR, f'{secrets.token_hex(16)}.partial')
+
+class UploadRequest(Request):
+    """Request that spools uploaded files straight into media/.uploads"""
+    # Werkzeug would otherwise buffer each file part in a temporary file
+    # elsewhere, only for it to be copied again into media/. Spooling on the
+    # same filesystem lets save_upload() move it into place with a rename.
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # Not mkstemp: its 0600 mode would stick to the published file
+        path = new_upload_spool()
+        self.__dict__.setdefault('upload_spools', []).append(path)
+        return open(path, 'x+b', buffering=UPLOAD_CHUNK_SIZE)
+    
+    def close(self):
+        super().close()
+        # Remove spools that save_upload() didn't move into place
+        for path in self.__dict__.get('upload_spools', ()):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+app.request_class = UploadRequest
 
 # ============ DATABASE SETUP ============
 
-def get_db():
-    """Get database connection with row factory"""
-    conn = sqlite3.connect(DB_PATH)
+def connect_db():
+    """Open a database connection with row factory"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None,
+                           cached_statements=DB_STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    # Per-connection tuning: WAL makes NORMAL sync safe, and readers wait
+    # on a busy writer instead of failing straight away
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA cache_size=-64000')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA busy_timeout=30000')
     return conn
 
+# Connections are opened once and reused across requests so SQLite keeps its
+# page cache warm instead of reopening the database file on every hit.
+# The pool is created on first use so every gunicorn worker gets its own.
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = queue.Queue(maxsize=DB_POOL_SIZE)
+                for _ in range(DB_POOL_SIZE):
+                    pool.put(connect_db())
+                _pool = pool
+    return _pool
+
+@contextmanager
+def db_conn():
+    """Check out a pooled database connection for the duration of a block"""
+    pool = get_pool()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        # Never hand a connection that is still inside a transaction (and
+        # holding the write lock) to the next request
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            pool.put(conn)
+
+@contextmanager
+def db_transaction():
+    """Check out a pooled connection and run the block as one transaction"""
+    with db_conn() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
 def init_db():
     """Initialize database tables"""
-    conn = get_db()
-    conn.executescript('''
-        CREATE TABLE IF NOT EXISTS content (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            description TEXT,
-            type TEXT NOT NULL CHECK(type IN ('movie', 'series')),
-            genre TEXT,
-            year INTEGER,
-            thumbnail TEXT,
-            video_path TEXT,
-            duration INTEGER,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS episodes (
-            id TEXT PRIMARY KEY,
-            content_id TEXT NOT NULL,
-            season INTEGER NOT NULL,
-            episode INTEGER NOT NULL,
-            title TEXT,
-            description TEXT,
-            video_path TEXT,
-            duration INTEGER,
-            thumbnail TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (content_id) REFERENCES content(id) ON DELETE CASCADE
-        );
-    ''')
-    conn.commit()
-    conn.close()
+    # Use a one-off connection so importing the app never opens the pool
+    conn = connect_db()
+    try:
+        # WAL is persistent in the database file, so it only needs setting once
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS content (
+                id TEXT PRIMARY KEY,
+                title TEXT NOT NULL,
+                description TEXT,
+                type TEXT NOT NULL CHECK(type IN ('movie', 'series')),
+                genre TEXT,
+                year INTEGER,
+                thumbnail TEXT,
+                video_path TEXT,
+                duration INTEGER,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS episodes (
+                id TEXT PRIMARY KEY,
+                content_id TEXT NOT NULL,
+                season INTEGER NOT NULL,
+                episode INTEGER NOT NULL,
+                title TEXT,
+                description TEXT,
+                video_path TEXT,
+                duration INTEGER,
+                thumbnail TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (content_id) REFERENCES content(id) ON DELETE CASCADE
+            );
+
+            -- Bumped by triggers on every catalogue write, used for ETags
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK(id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS content_version_insert AFTER INSERT ON content BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS content_version_update AFTER UPDATE ON content BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS content_version_delete AFTER DELETE ON content BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS episodes_version_insert AFTER INSERT ON episodes BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS episodes_version_update AFTER UPDATE ON episodes BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END;
+            CREATE TRIGGER IF NOT EXISTS episodes_version_delete AFTER DELETE ON episodes BEGIN
+                UPDATE catalog_version SET version = version + 1;
+            END;
+
+            CREATE INDEX IF NOT EXISTS idx_content_type_created ON content(type, created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_content_created ON content(created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_episodes_content ON episodes(content_id, season, episode);
+        ''')
+
+        # Full-text index over title/description, kept in sync by triggers.
+        # Rows are keyed by content.id (stored UNINDEXED) rather than rowid:
+        # content has a TEXT primary key, so its implicit rowids may be
+        # renumbered by VACUUM and would silently point hits at other rows.
+        # The cost is that the update/delete triggers scan the FTS table to
+        # find the row, which is fine for an occasional catalogue edit.
+        # Every gunicorn worker runs this on import, so the existence check,
+        # the create and the initial fill share one write transaction; two
+        # workers starting together must not both copy the catalogue in.
+        # (executescript would commit first, so each statement runs alone.)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            search_exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_search'"
+            ).fetchone()
+            if search_exists is None:
+                conn.execute('''
+                    CREATE VIRTUAL TABLE content_search USING fts5(
+                        id UNINDEXED, title, description
+                    )
+                ''')
+                # Index content added before the search table existed
+                conn.execute(
+                    'INSERT INTO content_search(id, title, description) '
+                    'SELECT id, title, description FROM content'
+                )
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS content_search_insert AFTER INSERT ON content BEGIN
+                    INSERT INTO content_search(id, title, description)
+                    VALUES (new.id, new.title, new.description);
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS content_search_delete AFTER DELETE ON content BEGIN
+                    DELETE FROM content_search WHERE id = old.id;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS content_search_update AFTER UPDATE ON content BEGIN
+                    UPDATE content_search
+                    SET id = new.id, title = new.title, description = new.description
+                    WHERE id = old.id;
+                END
+            ''')
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+
+# ============ QUERIES ============
+
+# Shared constants so every call sends identical SQL text and hits the
+# connection's prepared statement cache instead of being re-parsed
+
+SQL_CATALOG_VERSION = 'SELECT version FROM catalog_version WHERE id = 1'
+SQL_ALL_CONTENT = 'SELECT * FROM content ORDER BY created_at DESC'
+SQL_CONTENT_BY_TYPE = 'SELECT * FROM content WHERE type = ? ORDER BY created_at DESC'
+SQL_RECENT_CONTENT = 'SELECT * FROM content ORDER BY created_at DESC LIMIT ?'
+SQL_SEARCH_CONTENT = '''
+    SELECT c.* FROM content_search s
+    JOIN content c ON c.id = s.id
+    WHERE content_search MATCH ?
+    ORDER BY s.rank
+'''
+SQL_CONTENT_BY_ID = 'SELECT * FROM content WHERE id = ?'
+SQL_CONTENT_WITH_EPISODES = '''
+    SELECT c.*, (
+        SELECT json_group_array(json_object(
+            'id', e.id, 'content_id', e.content_id, 'season', e.season, 'episode', e.episode,
+            'title', e.title, 'description', e.description, 'video_path', e.video_path,
+            'duration', e.duration, 'thumbnail', e.thumbnail, 'created_at', e.created_at
+        ))
+        FROM (SELECT * FROM episodes WHERE content_id = c.id ORDER BY season, episode) e
+    ) AS episodes_json
+    FROM content c WHERE c.id = ?
+'''
+SQL_INSERT_CONTENT = '''
+    INSERT INTO content (id, title, description, type, genre, year, thumbnail, video_path)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_INSERT_EPISODE = '''
+    INSERT INTO episodes (id, content_id, season, episode, title, description, video_path, thumbnail)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+SQL_DELETE_CONTENT = 'DELETE FROM content WHERE id = ? RETURNING video_path, thumbnail'
+SQL_DELETE_EPISODES_BY_CONTENT = 'DELETE FROM episodes WHERE content_id = ? RETURNING video_path, thumbnail'
 
 def row_to_dict(row):
     """Convert sqlite Row to dictionary"""
@@ -77,8 +325,168 @@ def rows_to_list(rows):
     """Convert list of sqlite Rows to list of dictionaries"""
     return [dict(row) for row in rows]
 
+def json_response(obj):
+    """Serialize obj with orjson into an application/json response"""
+    return Response(orjson.dumps(obj), mimetype='application/json')
+
+# Serialized catalogue responses keyed by path + query string, each stored
+# with the catalog version it was built from
+CATALOG_CACHE_SIZE = 64
+_catalog_cache = {}
+
+def catalog_cached(view):
+    """Serve a catalogue GET route from cache, revalidated by ETag"""
+    # The ETag is the database's catalog_version, which triggers bump on every
+    # write, so it stays correct across gunicorn workers and restarts
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with db_conn() as conn:
+            version = conn.execute(SQL_CATALOG_VERSION).fetchone()[0]
+        etag = str(version)
+        
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            key = request.full_path
+            cached = _catalog_cache.get(key)
+            if cached is not None and cached[0] == version:
+                response = Response(cached[1], mimetype='application/json')
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if len(_catalog_cache) >= CATALOG_CACHE_SIZE:
+                    _catalog_cache.clear()
+                _catalog_cache[key] = (version, response.get_data())
+        
+        # Browsers revalidate every time, which is a cheap 304 until a write
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
+def upload_suffix(filename):
+    """Lower-cased extension of an uploaded file name, or '' if it isn't alphanumeric"""
+    ext = os.path.splitext(filename)[1]
+    return ext.lower() if _SAFE_SUFFIX.fullmatch(ext) else ''
+
+def save_upload(upload, dest):
+    """Move an uploaded file to dest, only making it visible once complete"""
+    stream = upload.stream
+    spool = getattr(stream, 'name', None)
+    if isinstance(spool, str) and os.path.dirname(spool) == str(UPLOADS_DIR):
+        # Already written to disk by UploadRequest, so just rename it
+        stream.close()
+        os.replace(spool, dest)
+        return
+    
+    # Not spooled by UploadRequest: copy through a hidden partial file
+    partial = new_upload_spool()
+    try:
+        with open(partial, 'xb', buffering=UPLOAD_CHUNK_SIZE) as f:
+            shutil.copyfileobj(stream, f, UPLOAD_CHUNK_SIZE)
+        os.replace(partial, dest)
+    except BaseException:
+        try:
+            os.unlink(partial)
+        except FileNotFoundError:
+            pass
+        raise
+
+def read_range(f, start, stop):
+    """Yield bytes start..stop of an open video file in STREAM_CHUNK_SIZE blocks"""
+    with f:
+        fd = f.fileno()
+        offset = start
+        while offset < stop:
+            chunk = os.pread(fd, min(STREAM_CHUNK_SIZE, stop - offset), offset)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield chunk
+
+def video_validators(st):
+    """ETag and Last-Modified for a video, from its fstat result"""
+    last_modified = datetime.fromtimestamp(int(st.st_mtime), timezone.utc)
+    return f'{st.st_mtime_ns:x}-{st.st_size:x}', last_modified
+
+def if_range_matches(etag, last_modified):
+    """Whether a request's If-Range (if any) still refers to this file"""
+    if 'If-Range' not in request.headers:
+        return True
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return if_range.etag == etag
+    return if_range.date is not None and if_range.date >= last_modified
+
+def parse_range(match, file_size):
+    """Turn a _RANGE_RE match into (start, stop), or None if unsatisfiable"""
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        stop = min(int(last) + 1, file_size) if last else file_size
+    elif last:
+        start = max(file_size - int(last), 0)
+        stop = file_size
+    else:
+        return None
+    if start >= stop:
+        return None
+    return start, stop
+
+def remove_media(media_path):
+    """Move a stored /media/... file into the trash if it exists"""
+    # A rename is instant regardless of file size; the trash thread does the
+    # slow unlink later, outside the request
+    if media_path:
+        media_file = BASE_DIR / media_path.lstrip('/')
+        try:
+            os.replace(media_file, TRASH_DIR / f'{time.time_ns()}_{media_file.name}')
+        except FileNotFoundError:
+            pass
+
+def empty_trash():
+    """Permanently delete everything in the trash folder"""
+    with os.scandir(TRASH_DIR) as entries:
+        for entry in entries:
+            try:
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # Another worker got to it first
+            except OSError as e:
+                # Keep going so one stuck file doesn't block the rest of the sweep
+                app.logger.warning('Failed to delete %s from trash: %s', entry.name, e)
+
+def remove_stale_uploads():
+    """Delete upload spools left behind by workers killed mid-upload"""
+    # Live uploads keep writing to their spool, so only long-untouched ones go
+    cutoff = time.time() - UPLOAD_STALE_AGE
+    with os.scandir(UPLOADS_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                app.logger.warning('Failed to delete stale upload %s: %s', entry.name, e)
+
+def trash_worker():
+    """Background loop that empties the trash and clears stale upload spools"""
+    while True:
+        time.sleep(TRASH_EMPTY_INTERVAL)
+        try:
+            empty_trash()
+        except OSError as e:
+            app.logger.warning('Failed to empty trash: %s', e)
+        try:
+            remove_stale_uploads()
+        except OSError as e:
+            app.logger.warning('Failed to clear stale uploads: %s', e)
+
 # Initialize database on startup
 init_db()
+threading.Thread(target=trash_worker, name='trash-worker', daemon=True).start()
 
 # ============ STATIC FILE SERVING ============
 
@@ -86,7 +494,16 @@ init_db()
 
 @app.route('/media/<path:filename>')
 def serve_media(filename):
-    return send_from_directory('media', filename)
+    if not all(_SAFE_NAME.fullmatch(part) for part in filename.split('/')):
+        return jsonify({'error': 'Invalid filename'}), 400
+    
+    # Stored names are random and never reused, so thumbnails can be cached
+    # for good; videos get a shorter lifetime so Range replays stay fresh
+    if filename.startswith('thumbnails/'):
+        response = send_from_directory('media', filename, max_age=THUMBNAIL_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    return send_from_directory('media', filename, max_age=VIDEO_MAX_AGE)
 
 # Catch-all for static files (must be last, after API routes)
 # This is handled by Flask's static_folder setting
@@ -94,70 +511,70 @@ def serve_media(filename):
 # ============ API ROUTES ============
 
 @app.route('/api/content', methods=['GET'])
+@catalog_cached
 def get_all_content():
     """Get all content"""
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM content ORDER BY created_at DESC').fetchall()
-    conn.close()
-    return jsonify(rows_to_list(rows))
+    with db_conn() as conn:
+        rows = conn.execute(SQL_ALL_CONTENT).fetchall()
+    return json_response(rows_to_list(rows))
 
 @app.route('/api/content/type/<content_type>', methods=['GET'])
+@catalog_cached
 def get_content_by_type(content_type):
     """Get content by type (movies or series)"""
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM content WHERE type = ? ORDER BY created_at DESC', (content_type,)).fetchall()
-    conn.close()
-    return jsonify(rows_to_list(rows))
+    with db_conn() as conn:
+        rows = conn.execute(SQL_CONTENT_BY_TYPE, (content_type,)).fetchall()
+    return json_response(rows_to_list(rows))
 
 @app.route('/api/content/recent/<int:limit>', methods=['GET'])
+@catalog_cached
 def get_recent_content(limit):
     """Get recent content"""
-    conn = get_db()
-    rows = conn.execute('SELECT * FROM content ORDER BY created_at DESC LIMIT ?', (limit,)).fetchall()
-    conn.close()
-    return jsonify(rows_to_list(rows))
+    with db_conn() as conn:
+        rows = conn.execute(SQL_RECENT_CONTENT, (limit,)).fetchall()
+    return json_response(rows_to_list(rows))
 
 @app.route('/api/content/search', methods=['GET'])
+@catalog_cached
 def search_content():
     """Search content by title or description"""
     query = request.args.get('q', '')
-    search_term = f'%{query}%'
-    conn = get_db()
-    rows = conn.execute(
-        'SELECT * FROM content WHERE title LIKE ? OR description LIKE ?',
-        (search_term, search_term)
-    ).fetchall()
-    conn.close()
-    return jsonify(rows_to_list(rows))
+    # Quote each word so user input can't inject FTS syntax, and prefix-match
+    # it so partially typed words still find results
+    words = query.replace('"', ' ').split()
+    with db_conn() as conn:
+        if words:
+            match = ' '.join(f'"{word}"*' for word in words)
+            rows = conn.execute(SQL_SEARCH_CONTENT, (match,)).fetchall()
+        else:
+            rows = conn.execute(SQL_ALL_CONTENT).fetchall()
+    return json_response(rows_to_list(rows))
 
 @app.route('/api/content/<content_id>', methods=['GET'])
+@catalog_cached
 def get_content_by_id(content_id):
     """Get single content by ID"""
-    conn = get_db()
-    row = conn.execute('SELECT * FROM content WHERE id = ?', (content_id,)).fetchone()
+    # Episodes come back as a JSON array column, so a detail page is one query
+    with db_conn() as conn:
+        row = conn.execute(SQL_CONTENT_WITH_EPISODES, (content_id,)).fetchone()
     
     if row is None:
-        conn.close()
         return jsonify({'error': 'Content not found'}), 404
     
     content = row_to_dict(row)
+    episodes_json = content.pop('episodes_json')
     
     # If it's a series, include episodes
     if content['type'] == 'series':
-        episodes = conn.execute(
-            'SELECT * FROM episodes WHERE content_id = ? ORDER BY season, episode',
-            (content_id,)
-        ).fetchall()
-        content['episodes'] = rows_to_list(episodes)
+        content['episodes'] = orjson.loads(episodes_json)
     
-    conn.close()
-    return jsonify(content)
+    return json_response(content)
 
 @app.route('/api/content', methods=['POST'])
 def upload_content():
     """Upload new content"""
     try:
-        content_id = str(uuid.uuid4())
+        content_id = secrets.token_hex(16)
         title = request.form.get('title', '')
         description = request.form.get('description', '')
         content_type = request.form.get('type', 'movie')
@@ -171,28 +588,23 @@ def upload_content():
         if 'video' in request.files:
             video = request.files['video']
             if video.filename:
-                ext = Path(video.filename).suffix
-                video_filename = f'{uuid.uuid4()}{ext}'
-                video.save(VIDEOS_DIR / video_filename)
+                ext = upload_suffix(video.filename)
+                video_filename = f'{secrets.token_hex(16)}{ext}'
+                save_upload(video, VIDEOS_DIR / video_filename)
                 video_path = f'/media/videos/{video_filename}'
         
         # Handle thumbnail upload
         if 'thumbnail' in request.files:
             thumbnail = request.files['thumbnail']
             if thumbnail.filename:
-                ext = Path(thumbnail.filename).suffix
-                thumb_filename = f'{uuid.uuid4()}{ext}'
-                thumbnail.save(THUMBNAILS_DIR / thumb_filename)
+                ext = upload_suffix(thumbnail.filename)
+                thumb_filename = f'{secrets.token_hex(16)}{ext}'
+                save_upload(thumbnail, THUMBNAILS_DIR / thumb_filename)
                 thumbnail_path = f'/media/thumbnails/{thumb_filename}'
         
         # Insert into database
-        conn = get_db()
-        conn.execute('''
-            INSERT INTO content (id, title, description, type, genre, year, thumbnail, video_path)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (content_id, title, description, content_type, genre, int(year) if year else None, thumbnail_path, video_path))
-        conn.commit()
-        conn.close()
+        with db_conn() as conn:
+            conn.execute(SQL_INSERT_CONTENT, (content_id, title, description, content_type, genre, int(year) if year else None, thumbnail_path, video_path))
         
         return jsonify({
             'id': content_id,
@@ -208,19 +620,17 @@ def upload_content():
 def add_episode(content_id):
     """Add episode to series"""
     try:
-        conn = get_db()
-        row = conn.execute('SELECT * FROM content WHERE id = ?', (content_id,)).fetchone()
+        with db_conn() as conn:
+            row = conn.execute(SQL_CONTENT_BY_ID, (content_id,)).fetchone()
         
         if row is None:
-            conn.close()
             return jsonify({'error': 'Series not found'}), 404
         
         content = row_to_dict(row)
         if content['type'] != 'series':
-            conn.close()
             return jsonify({'error': 'Can only add episodes to series'}), 400
         
-        episode_id = str(uuid.uuid4())
+        episode_id = secrets.token_hex(16)
         season = request.form.get('season', 1)
         episode = request.form.get('episode', 1)
         title = request.form.get('title', '')
@@ -233,26 +643,22 @@ def add_episode(content_id):
         if 'video' in request.files:
             video = request.files['video']
             if video.filename:
-                ext = Path(video.filename).suffix
-                video_filename = f'{uuid.uuid4()}{ext}'
-                video.save(VIDEOS_DIR / video_filename)
+                ext = upload_suffix(video.filename)
+                video_filename = f'{secrets.token_hex(16)}{ext}'
+                save_upload(video, VIDEOS_DIR / video_filename)
                 video_path = f'/media/videos/{video_filename}'
         
         # Handle thumbnail upload
         if 'thumbnail' in request.files:
             thumbnail = request.files['thumbnail']
             if thumbnail.filename:
-                ext = Path(thumbnail.filename).suffix
-                thumb_filename = f'{uuid.uuid4()}{ext}'
-                thumbnail.save(THUMBNAILS_DIR / thumb_filename)
+                ext = upload_suffix(thumbnail.filename)
+                thumb_filename = f'{secrets.token_hex(16)}{ext}'
+                save_upload(thumbnail, THUMBNAILS_DIR / thumb_filename)
                 thumbnail_path = f'/media/thumbnails/{thumb_filename}'
         
-        conn.execute('''
-            INSERT INTO episodes (id, content_id, season, episode, title, description, video_path, thumbnail)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (episode_id, content_id, int(season), int(episode), title, description, video_path, thumbnail_path))
-        conn.commit()
-        conn.close()
+        with db_conn() as conn:
+            conn.execute(SQL_INSERT_EPISODE, (episode_id, content_id, int(season), int(episode), title, description, video_path, thumbnail_path))
         
         return jsonify({
             'id': episode_id,
@@ -266,29 +672,19 @@ def add_episode(content_id):
 def delete_content(content_id):
     """Delete content"""
     try:
-        conn = get_db()
-        row = conn.execute('SELECT * FROM content WHERE id = ?', (content_id,)).fetchone()
-        
-        if row is None:
-            conn.close()
-            return jsonify({'error': 'Content not found'}), 404
+        # Remove the content and its episodes together in one commit
+        with db_transaction() as conn:
+            row = conn.execute(SQL_DELETE_CONTENT, (content_id,)).fetchone()
+            
+            if row is None:
+                return jsonify({'error': 'Content not found'}), 404
+            
+            episodes = conn.execute(SQL_DELETE_EPISODES_BY_CONTENT, (content_id,)).fetchall()
         
-        content = row_to_dict(row)
-        
-        # Delete associated files
-        if content['video_path']:
-            video_file = BASE_DIR / content['video_path'].lstrip('/')
-            if video_file.exists():
-                video_file.unlink()
-        
-        if content['thumbnail']:
-            thumb_file = BASE_DIR / content['thumbnail'].lstrip('/')
-            if thumb_file.exists():
-                thumb_file.unlink()
-        
-        conn.execute('DELETE FROM content WHERE id = ?', (content_id,))
-        conn.commit()
-        conn.close()
+        # Delete associated files once the rows are gone
+        for media in [row, *episodes]:
+            remove_media(media['video_path'])
+            remove_media(media['thumbnail'])
         
         return jsonify({'message': 'Content deleted successfully'})
         
@@ -300,74 +696,118 @@ def delete_content(content_id):
 @app.route('/stream/<filename>')
 def stream_video(filename):
     """Stream video with range request support for seeking"""
-    video_path = VIDEOS_DIR / filename
+    if not _SAFE_NAME.fullmatch(filename):
+        return jsonify({'error': 'Invalid filename'}), 400
     
-    if not video_path.exists():
-        return jsonify({'error': 'Video not found'}), 404
+    # Determine content type based on extension
+    content_type = VIDEO_CONTENT_TYPES.get(os.path.splitext(filename)[1].lower(), 'video/mp4')
+    
+    # Behind nginx, hand the transfer off to its internal location so the
+    # video bytes never pass through Python (see nginx.conf)
+    if request.headers.get('X-Internal-Proxy'):
+        return Response(headers={
+            'X-Accel-Redirect': f'/protected/videos/{filename}',
+            'Content-Type': content_type
+        })
     
-    file_size = video_path.stat().st_size
+    # Reject malformed or multi-part ranges up front, before any syscalls
     range_header = request.headers.get('Range')
+    range_match = None
+    if range_header:
+        range_match = _RANGE_RE.fullmatch(range_header)
+        if range_match is None:
+            return Response(status=416)
     
-    # Determine content type based on extension
-    ext = video_path.suffix.lower()
-    content_types = {
-        '.mp4': 'video/mp4',
-        '.webm': 'video/webm',
-        '.mkv': 'video/x-matroska',
-        '.avi': 'video/x-msvideo',
-        '.mov': 'video/quicktime',
-        '.m4v': 'video/mp4'
-    }
-    content_type = content_types.get(ext, 'video/mp4')
+    # Opening first and using fstat replaces separate exists/stat/open calls
+    video_path = os.path.join(VIDEOS_DIR_STR, filename)
+    try:
+        f = open(video_path, 'rb', buffering=0)
+    except OSError:
+        return jsonify({'error': 'Video not found'}), 404
+    st = os.fstat(f.fileno())
+    file_size = st.st_size
+    etag, last_modified = video_validators(st)
     
-    if range_header:
-        # Parse range header
-        byte_range = range_header.replace('bytes=', '').split('-')
-        start = int(byte_range[0])
-        end = int(byte_range[1]) if byte_range[1] else file_size - 1
-        
-        if start >= file_size:
-            return Response(status=416)  # Range not satisfiable
-        
-        end = min(end, file_size - 1)
-        chunk_size = end - start + 1
+    # Ranges are answered here rather than by Werkzeug's 8 KiB range wrapper.
+    # With the server's wsgi.file_wrapper the file is handed over positioned at
+    # the range start and gunicorn sends exactly Content-Length bytes via
+    # sendfile(); without one the range is read in 1 MiB pread() blocks
+    if range_match and if_range_matches(etag, last_modified):
+        bounds = parse_range(range_match, file_size)
+        if bounds is None:
+            f.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{file_size}'})
         
-        def generate():
-            with open(video_path, 'rb') as f:
-                f.seek(start)
-                remaining = chunk_size
-                while remaining > 0:
-                    chunk = f.read(min(8192, remaining))
-                    if not chunk:
-                        break
-                    remaining -= len(chunk)
-                    yield chunk
-        
-        return Response(
-            generate(),
+        start, stop = bounds
+        file_wrapper = request.environ.get('wsgi.file_wrapper')
+        if file_wrapper:
+            f.seek(start)
+            body = file_wrapper(f, STREAM_CHUNK_SIZE)
+        else:
+            body = read_range(f, start, stop)
+        response = Response(
+            body,
             status=206,
             headers={
                 'Content-Type': content_type,
-                'Content-Range': f'bytes {start}-{end}/{file_size}',
+                'Content-Range': f'bytes {start}-{stop - 1}/{file_size}',
                 'Accept-Ranges': 'bytes',
-                'Content-Length': str(chunk_size)
-            }
+                'Content-Length': str(stop - start)
+            },
+            direct_passthrough=True
         )
-    else:
-        # Full file response
-        return send_file(video_path, mimetype=content_type)
-
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True
+        return response
+    f.close()
+    
+    # Full files, and ranges whose If-Range no longer matches (answered with
+    # the whole file): Werkzeug hands the open file to wsgi.file_wrapper
+    return send_file(video_path, mimetype=content_type, conditional=True,
+                     etag=etag, last_modified=last_modified)
 
 # ============ STATIC FILE FALLBACK ============
 
+def load_public_files():
+    """Read every file under public/ into memory as (body, mimetype, etag)"""
+    files = {}
+    for path in PUBLIC_DIR.rglob('*'):
+        if path.is_file():
+            st = path.stat()
+            mimetype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+            files[path.relative_to(PUBLIC_DIR).as_posix()] = (
+                path.read_bytes(), mimetype, f'{st.st_mtime_ns:x}-{st.st_size:x}'
+            )
+    return files
+
+# The frontend is a handful of small files, so serve them from memory. In
+# debug mode they are read from disk on each request so edits show up live.
+_public_files = {} if app.debug else load_public_files()
+
+def send_public_file(filename):
+    """Send a file from public/, from the preloaded copy when there is one"""
+    cached = _public_files.get(filename)
+    if cached is None:
+        return send_from_directory('public', filename)
+    
+    body, mimetype, etag = cached
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
 @app.route('/')
 def index():
-    return send_from_directory('public', 'index.html')
+    return send_public_file('index.html')
 
 @app.route('/<path:filename>')
 def serve_static(filename):
     """Serve static files from public directory"""
-    return send_from_directory('public', filename)
+    return send_public_file(filename)
 
 
 # ============ SERVER STARTUP ============
@@ -383,6 +823,8 @@ if __name__ == '__main__':
   |                                                              |
   |   Run 'ipconfig' to find your network IP address             |
   |                                                              |
+  |   Development server only - use 'gunicorn wsgi:app' to serve |
+  |                                                              |
   ================================================================
     ''')
     
@@ -0,0 +1,11 @@
+"""
+HomeStream - WSGI entry point
+
+Production:
+    gunicorn wsgi:app
+
+gunicorn.conf.py is picked up automatically; the equivalent explicit command is:
+    gunicorn -k gthread -w $((2*$(nproc)+1)) --threads 8 --keep-alive 30 -b 0.0.0.0:3000 wsgi:app
+"""
+
+from server import app